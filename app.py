@@ -4,6 +4,7 @@ from fastapi.responses import JSONResponse  # <-- Agregar esto
 from pydantic import BaseModel
 from typing import Optional
 import uvicorn
+import asyncio
 import json
 import traceback
 import psutil  # <-- Mover aquí
@@ -12,12 +13,24 @@ from datetime import datetime  # <-- Agregar esto
 
 from database import DatabaseManager
 from ollama_handler import OllamaHandlerOptimized
+from jobs import JobStore, JobWorker, ESTADOS_FINALES
+from llm_transport import crear_transporte
 from models.agente import AgenteMantenimientoOptimizado
 
 # Inicializar componentes
 db = DatabaseManager()
-ollama = OllamaHandlerOptimized(model="phi")  # Usar phi por ser más ligero
+# LLM_TRANSPORTE=grabar captura tráfico real; =replay lo reproduce sin inferencia
+transporte = crear_transporte(
+    os.getenv("LLM_TRANSPORTE", "ollama"),
+    ruta=os.getenv("LLM_LOG", "data/llm_log.jsonl"),
+    latencia=os.getenv("LLM_LATENCIA", "ninguna"),
+    escala=float(os.getenv("LLM_ESCALA", "1.0"))
+)
+ollama = OllamaHandlerOptimized(model="phi", transporte=transporte)  # Usar phi por ser más ligero
 agente = AgenteMantenimientoOptimizado(db, ollama)
+jobs = JobStore(db.db_path)
+# Más de 1 worker solo tiene sentido en replay (pruebas de carga)
+worker = JobWorker(jobs, agente.procesar_reporte, num_workers=int(os.getenv("JOB_WORKERS", "1")))
 
 app = FastAPI(title="Agente de Mantenimiento Optimizado", version="1.0")
 
@@ -42,6 +55,15 @@ class Feedback(BaseModel):
     exito: bool
     notas: Optional[str] = None
 
+@app.on_event("startup")
+async def iniciar_workers():
+    worker.iniciar()
+
+@app.on_event("shutdown")
+async def detener_workers():
+    worker.detener()
+    transporte.cerrar()
+
 @app.get("/")
 async def root():
     return {
@@ -51,21 +73,35 @@ async def root():
         "optimizado": "8GB RAM"
     }
 
-@app.post("/diagnosticar")
+@app.post("/diagnosticar", status_code=202)
 async def diagnosticar(reporte: ReporteFalla):
-    """Endpoint principal para diagnóstico"""
+    """Encolar diagnóstico y devolver el id del job de inmediato"""
     try:
-        diagnostico = agente.procesar_reporte(reporte.model_dump())
+        job_id = jobs.crear(reporte.model_dump())
+        worker.notificar()
         
         return {
             "success": True,
-            "data": diagnostico,
+            "job_id": job_id,
+            "status": "pendiente",
             "timestamp": datetime.now().isoformat()
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+async def consultar_job(job_id: str, esperar: float = 0):
+    """Estado del job; con esperar>0 se mantiene la conexión hasta que termine"""
+    limite = asyncio.get_running_loop().time() + min(esperar, 60)
+    while True:
+        job = jobs.obtener(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job no encontrado o expirado")
+        if job["status"] in ESTADOS_FINALES or asyncio.get_running_loop().time() >= limite:
+            return {"success": True, **job}
+        await asyncio.sleep(0.5)
+
 @app.get("/equipos")
 async def listar_equipos():
     """Listar equipos en la base de conocimiento"""
@@ -117,7 +153,9 @@ async def estado_sistema():
         "memoria_libre_GB": round(memoria.free / (1024**3), 2),
         "memoria_proceso_MB": round(proceso.memory_info().rss / (1024**2), 2),
         "cpu_porcentaje": psutil.cpu_percent(),
-        "modelo_activo": ollama.model
+        "modelo_activo": ollama.model,
+        "prompts": ollama.metricas_prompts(),
+        "jobs": jobs.contar_por_estado()
     }
 
 # MANEJADOR DE EXCEPCIONES GLOBAL - FUERA DE LAS FUNCIONES
@@ -1,8 +1,20 @@
 import sqlite3
+import hashlib
 import json
 import os
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
+
+# Versión del esquema guardada en PRAGMA user_version
+SCHEMA_VERSION = 3
+
+# Solo textos que se repiten entre filas; el historial (texto libre del LLM) va en línea
+TABLAS_INTERNADAS = ("causas", "soluciones", "herramientas")
+
+
+def _hash_texto(texto: str) -> int:
+    """Prefijo de 64 bits del sha1: clave de internado mucho más corta que el texto"""
+    return int.from_bytes(hashlib.sha1(texto.encode("utf-8")).digest()[:8], "big", signed=True)
 
 class DatabaseManager:
     def __init__(self, db_path="data/knowledge_base.db"):
@@ -35,8 +47,8 @@ class DatabaseManager:
             equipo_tipo TEXT NOT NULL,
             sintoma TEXT NOT NULL,
             descripcion TEXT,
-            causas TEXT,  -- JSON array
-            soluciones TEXT,  -- JSON array
+            causas TEXT,  -- JSON legado, migrado a falla_causas
+            soluciones TEXT,  -- JSON legado, migrado a falla_soluciones
             frecuencia INTEGER DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -55,17 +67,151 @@ class DatabaseManager:
         )
         ''')
         
+        # El esquema v2 indexaba el texto completo (UNIQUE), duplicando cada cadena
+        tablas_v2 = self._apartar_tablas_v2(cursor)
+        
+        # Textos internados: cada causa/solución/herramienta se guarda una sola vez,
+        # indexada por un hash corto en lugar del texto
+        for tabla in TABLAS_INTERNADAS:
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tabla} (
+                id INTEGER PRIMARY KEY,
+                hash INTEGER NOT NULL UNIQUE,
+                texto TEXT NOT NULL
+            )
+            ''')
+        for tabla in tablas_v2:
+            filas = cursor.execute(f"SELECT id, texto FROM {tabla}_v2").fetchall()
+            cursor.executemany(
+                f"INSERT INTO {tabla} (id, hash, texto) VALUES (?, ?, ?)",
+                [(id_, _hash_texto(texto), texto) for id_, texto in filas]
+            )
+            cursor.execute(f"DROP TABLE {tabla}_v2")
+        
+        # Enlaces ordenados falla -> causas/soluciones
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS falla_causas (
+            falla_id INTEGER NOT NULL REFERENCES fallas(id),
+            causa_id INTEGER NOT NULL REFERENCES causas(id),
+            orden INTEGER NOT NULL,
+            PRIMARY KEY (falla_id, orden)
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS falla_soluciones (
+            falla_id INTEGER NOT NULL REFERENCES fallas(id),
+            solucion_id INTEGER NOT NULL REFERENCES soluciones(id),
+            orden INTEGER NOT NULL,
+            PRIMARY KEY (falla_id, orden)
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS historial_herramientas (
+            historial_id INTEGER NOT NULL REFERENCES historial(id),
+            herramienta_id INTEGER NOT NULL REFERENCES herramientas(id),
+            PRIMARY KEY (historial_id, herramienta_id)
+        ) WITHOUT ROWID
+        ''')
+        
+        # Vista de solo lectura del historial (se mantiene por compatibilidad con v2)
+        cursor.execute('''
+        CREATE VIEW IF NOT EXISTS historial_detalle AS
+        SELECT id, equipo_tipo, sintoma, diagnostico, solucion, exito, created_at
+        FROM historial
+        ''')
+        
         # Índices para mejor rendimiento
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fallas_equipo ON fallas(equipo_tipo)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fallas_sintoma ON fallas(sintoma)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_falla_causas_causa ON falla_causas(causa_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_falla_soluciones_solucion ON falla_soluciones(solucion_id)')
+        
+        migrado = self._migrar_a_normalizado(cursor) or bool(tablas_v2)
         
         conn.commit()
+        if migrado:
+            # Recuperar el espacio de los textos JSON y tablas reconstruidas
+            conn.execute("VACUUM")
         conn.close()
         
         # Cargar datos iniciales si no existen
         self._load_initial_data()
     
+    def _apartar_tablas_v2(self, cursor) -> List[str]:
+        """Renombrar tablas internadas sin columna hash para reconstruirlas"""
+        apartadas = []
+        for tabla in TABLAS_INTERNADAS:
+            columnas = {row[1] for row in cursor.execute(f"PRAGMA table_info({tabla})")}
+            if columnas and 'hash' not in columnas:
+                apartadas.append(tabla)
+        if apartadas:
+            # La vista y las referencias de los enlaces deben seguir apuntando al nombre original
+            cursor.execute("DROP VIEW IF EXISTS historial_detalle")
+            cursor.execute("PRAGMA legacy_alter_table = ON")
+            for tabla in apartadas:
+                cursor.execute(f"ALTER TABLE {tabla} RENAME TO {tabla}_v2")
+            cursor.execute("PRAGMA legacy_alter_table = OFF")
+        return apartadas
+    
+    def _migrar_a_normalizado(self, cursor):
+        """Pasar causas/soluciones JSON a tablas internadas y devolver el historial v2 a texto en línea"""
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return False
+        
+        fallas = cursor.execute(
+            "SELECT id, causas, soluciones FROM fallas WHERE causas IS NOT NULL OR soluciones IS NOT NULL"
+        ).fetchall()
+        for falla_id, causas, soluciones in fallas:
+            self._enlazar_falla(
+                cursor, falla_id,
+                json.loads(causas) if causas else [],
+                json.loads(soluciones) if soluciones else []
+            )
+        cursor.execute("UPDATE fallas SET causas = NULL, soluciones = NULL")
+        
+        # v2 internaba también el historial: el texto casi nunca se repite, así que vuelve a la fila
+        columnas = {row[1] for row in cursor.execute("PRAGMA table_info(historial)")}
+        historial_v2 = 'diagnostico_id' in columnas
+        if historial_v2:
+            cursor.execute('''
+            UPDATE historial SET
+                diagnostico = COALESCE(diagnostico, (SELECT texto FROM diagnosticos WHERE id = diagnostico_id)),
+                solucion = COALESCE(solucion, (SELECT texto FROM soluciones WHERE id = solucion_id)),
+                diagnostico_id = NULL,
+                solucion_id = NULL
+            WHERE diagnostico_id IS NOT NULL OR solucion_id IS NOT NULL
+            ''')
+            cursor.execute("DROP INDEX IF EXISTS idx_historial_solucion")
+            cursor.execute("DROP TABLE IF EXISTS diagnosticos")
+            cursor.execute(
+                "DELETE FROM soluciones WHERE id NOT IN (SELECT solucion_id FROM falla_soluciones)"
+            )
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return bool(fallas) or historial_v2
+    
+    def _internar(self, cursor, tabla: str, texto: Optional[str]) -> Optional[int]:
+        """Devolver el id del texto en la tabla internada, insertándolo si no existe"""
+        if texto is None:
+            return None
+        hash_texto = _hash_texto(texto)
+        cursor.execute(f"INSERT OR IGNORE INTO {tabla} (hash, texto) VALUES (?, ?)", (hash_texto, texto))
+        cursor.execute(f"SELECT id, texto FROM {tabla} WHERE hash = ?", (hash_texto,))
+        id_, guardado = cursor.fetchone()
+        if guardado != texto:
+            raise ValueError(f"Colisión de hash al internar en {tabla}")
+        return id_
     
+    def _enlazar_falla(self, cursor, falla_id: int, causas: Sequence[str], soluciones: Sequence[str]):
+        cursor.executemany(
+            "INSERT OR REPLACE INTO falla_causas (falla_id, causa_id, orden) VALUES (?, ?, ?)",
+            [(falla_id, self._internar(cursor, "causas", c), i) for i, c in enumerate(causas)]
+        )
+        cursor.executemany(
+            "INSERT OR REPLACE INTO falla_soluciones (falla_id, solucion_id, orden) VALUES (?, ?, ?)",
+            [(falla_id, self._internar(cursor, "soluciones", sol), i) for i, sol in enumerate(soluciones)]
+        )
 
     def _load_initial_data(self):
         """Cargar datos iniciales de mantenimiento común"""
@@ -98,26 +244,27 @@ class DatabaseManager:
         # Fallas comunes iniciales
         common_issues = [
             ("Laptop", "No enciende", "El equipo no muestra señal de vida",
-             '["Batería agotada", "Adaptador dañado", "Problema de motherboard"]',
-             '["Probar con otro cargador", "Retirar batería y conectar solo con cable", "Verificar led de carga"]'),
+             ["Batería agotada", "Adaptador dañado", "Problema de motherboard"],
+             ["Probar con otro cargador", "Retirar batería y conectar solo con cable", "Verificar led de carga"]),
             
             ("Impresora", "Atascamiento de papel", "El papel se traba al imprimir",
-             '["Papel mal colocado", "Rodillos sucios", "Tipo de papel incorrecto"]',
-             '["Apagar y retirar papel cuidadosamente", "Limpiar rodillos con paño seco", "Usar papel recomendado"]'),
+             ["Papel mal colocado", "Rodillos sucios", "Tipo de papel incorrecto"],
+             ["Apagar y retirar papel cuidadosamente", "Limpiar rodillos con paño seco", "Usar papel recomendado"]),
             
             ("Monitor", "Sin señal", "Muestra 'No signal' o pantalla negra",
-             '["Cable suelto", "Puerto dañado", "Configuración incorrecta"]',
-             '["Verificar conexiones", "Probar otro cable", "Cambiar fuente de entrada"]'),
+             ["Cable suelto", "Puerto dañado", "Configuración incorrecta"],
+             ["Verificar conexiones", "Probar otro cable", "Cambiar fuente de entrada"]),
         ]
         
         cursor.execute("SELECT COUNT(*) FROM fallas")
         if cursor.fetchone()[0] == 0:
-            for issue in common_issues:
+            for equipo_tipo, sintoma, descripcion, causas, soluciones in common_issues:
                 cursor.execute(
-                    """INSERT INTO fallas (equipo_tipo, sintoma, descripcion, causas, soluciones) 
-                       VALUES (?, ?, ?, ?, ?)""",
-                    issue
+                    """INSERT INTO fallas (equipo_tipo, sintoma, descripcion) 
+                       VALUES (?, ?, ?)""",
+                    (equipo_tipo, sintoma, descripcion)
                 )
+                self._enlazar_falla(cursor, cursor.lastrowid, causas, soluciones)
         
         conn.commit()
         conn.close()
@@ -149,16 +296,84 @@ class DatabaseManager:
         cursor.execute(query, params)
         results = [dict(row) for row in cursor.fetchall()]
         
-        # Parsear JSON en causas y soluciones
-        for result in results:
-            result['causas'] = json.loads(result['causas'])
-            result['soluciones'] = json.loads(result['soluciones'])
+        # Resolver causas y soluciones con un join por tabla para todas las fallas
+        if results:
+            ids = [result['id'] for result in results]
+            causas = self._textos_por_falla(cursor, "falla_causas", "causa_id", "causas", ids)
+            soluciones = self._textos_por_falla(cursor, "falla_soluciones", "solucion_id", "soluciones", ids)
+            for result in results:
+                result['causas'] = causas.get(result['id'], ())
+                result['soluciones'] = soluciones.get(result['id'], ())
         
         conn.close()
         return results
     
+    def _textos_por_falla(self, cursor, enlace: str, columna: str, tabla: str,
+                          falla_ids: List[int]) -> Dict[int, tuple]:
+        marcadores = ",".join("?" * len(falla_ids))
+        cursor.execute(
+            f"""SELECT e.falla_id, t.texto FROM {enlace} e
+                JOIN {tabla} t ON t.id = e.{columna}
+                WHERE e.falla_id IN ({marcadores})
+                ORDER BY e.falla_id, e.orden""",
+            falla_ids
+        )
+        agrupados: Dict[int, list] = {}
+        for falla_id, texto in cursor.fetchall():
+            agrupados.setdefault(falla_id, []).append(texto)
+        return {falla_id: tuple(textos) for falla_id, textos in agrupados.items()}
+    
+    def agregar_falla(self, equipo_tipo: str, sintoma: str, descripcion: str,
+                      causas: Sequence[str], soluciones: Sequence[str]) -> int:
+        """Registrar una falla nueva en la base de conocimiento"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "INSERT INTO fallas (equipo_tipo, sintoma, descripcion) VALUES (?, ?, ?)",
+            (equipo_tipo, sintoma, descripcion)
+        )
+        falla_id = cursor.lastrowid
+        self._enlazar_falla(cursor, falla_id, causas, soluciones)
+        
+        conn.commit()
+        conn.close()
+        return falla_id
+    
+    def frecuencia_causas(self, equipo_tipo: Optional[str] = None, limite: int = 10) -> List[tuple]:
+        """Causas más frecuentes (texto, fallas enlazadas, suma de frecuencia)"""
+        return self._frecuencia("falla_causas", "causa_id", "causas", equipo_tipo, limite)
+    
+    def frecuencia_soluciones(self, equipo_tipo: Optional[str] = None, limite: int = 10) -> List[tuple]:
+        """Soluciones más frecuentes (texto, fallas enlazadas, suma de frecuencia)"""
+        return self._frecuencia("falla_soluciones", "solucion_id", "soluciones", equipo_tipo, limite)
+    
+    def _frecuencia(self, enlace: str, columna: str, tabla: str,
+                    equipo_tipo: Optional[str], limite: int) -> List[tuple]:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        query = f"""
+        SELECT t.texto, COUNT(*) AS fallas, SUM(f.frecuencia) AS total
+        FROM {enlace} e
+        JOIN {tabla} t ON t.id = e.{columna}
+        JOIN fallas f ON f.id = e.falla_id
+        """
+        params = []
+        if equipo_tipo:
+            query += " WHERE f.equipo_tipo = ?"
+            params.append(equipo_tipo)
+        query += f" GROUP BY e.{columna} ORDER BY total DESC LIMIT ?"
+        params.append(limite)
+        
+        cursor.execute(query, params)
+        resultados = cursor.fetchall()
+        conn.close()
+        return resultados
+    
     def registrar_diagnostico(self, equipo_tipo: str, sintoma: str, 
-                             diagnostico: str, solucion: str, exito: bool = None):
+                             diagnostico: str, solucion: str, exito: bool = None,
+                             herramientas: Sequence[str] = ()):
         """Registrar diagnóstico en historial"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -168,9 +383,36 @@ class DatabaseManager:
                VALUES (?, ?, ?, ?, ?)""",
             (equipo_tipo, sintoma, diagnostico, solucion, exito)
         )
+        historial_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT OR IGNORE INTO historial_herramientas (historial_id, herramienta_id) VALUES (?, ?)",
+            [(historial_id, self._internar(cursor, "herramientas", h)) for h in herramientas]
+        )
         
         conn.commit()
         conn.close()
+        return historial_id
+
+    def historial_etiquetado(self, limite: Optional[int] = None) -> List[Dict]:
+        """Casos del historial con resultado conocido (exito no nulo)"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        query = """
+        SELECT equipo_tipo, sintoma, diagnostico, solucion, exito
+        FROM historial_detalle
+        WHERE exito IS NOT NULL
+        ORDER BY id"""
+        params = []
+        if limite:
+            query += " LIMIT ?"
+            params.append(limite)
+        
+        cursor.execute(query, params)
+        casos = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return casos
 
     def listar_equipos(self):
         """Lista todos los equipos únicos en la base de datos"""
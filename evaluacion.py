@@ -0,0 +1,334 @@
+"""Evaluación offline: calidad del diagnóstico vs latencia por configuración.
+
+Uso:
+    python evaluacion.py --fixture knowledge_base/evaluacion.jsonl --simulado
+    python evaluacion.py --db data/knowledge_base.db --grid grid.json --salida resultados.json
+    python evaluacion.py --replay data/llm_log.jsonl
+
+Con --replay los casos (prompts ya renderizados) y la configuración base salen del
+log de llm_transport; un --grid opcional se aplica sobre esa configuración y las
+combinaciones no grabadas aparecen como errores.
+"""
+import argparse
+import itertools
+import json
+import math
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from llm_transport import ReplayTransport, huella_sistema
+from ollama_handler import OllamaHandlerOptimized
+from prompt_templates import PLANTILLAS
+
+# Claves y tipos que debe traer un diagnóstico válido
+ESQUEMA = {
+    "diagnostico": str,
+    "causas_posibles": list,
+    "pasos_solucion": list,
+    "herramientas_necesarias": list,
+    "tiempo_estimado_minutos": (int, float),
+    "nivel_dificultad": str,
+    "precauciones": list,
+}
+
+GRID_POR_DEFECTO = {
+    "model": ["phi"],
+    "temperature": [0.1, 0.3],
+    "top_k": [20, 40],
+    "num_predict": [256, 512],
+    "num_ctx": [1024, 2048],
+}
+
+
+class FixtureTransport:
+    """Transporte que devuelve la respuesta grabada en el caso actual del fixture"""
+
+    def __init__(self):
+        self.grabacion: Optional[Dict[str, Any]] = None
+
+    def generar(self, **kwargs) -> Dict[str, Any]:
+        grabacion = self.grabacion or {}
+        texto = grabacion.get("respuesta", "")
+        return {
+            "response": texto,
+            "eval_count": grabacion.get("eval_count", len(texto.split())),
+            "total_duration": int(grabacion.get("duracion_ms", 0) * 1e6),
+        }
+
+    def cerrar(self):
+        pass
+
+
+class HandlerEvaluado(OllamaHandlerOptimized):
+    """Handler que conserva la respuesta cruda (o el error) de la última llamada"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ultima_respuesta: Optional[Dict[str, Any]] = None
+        self.ultimo_error: Optional[Exception] = None
+
+    def _generar(self, **kwargs) -> Dict[str, Any]:
+        # El handler convierte los fallos en un diagnóstico por defecto: aquí se anotan
+        try:
+            self.ultima_respuesta = super()._generar(**kwargs)
+        except Exception as e:
+            self.ultimo_error = e
+            raise
+        return self.ultima_respuesta
+
+
+def cargar_fixture(ruta: str) -> List[Dict[str, Any]]:
+    """Casos JSONL: equipo, sintoma, descripcion, soluciones y opcionalmente respuesta grabada"""
+    casos = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                casos.append(json.loads(linea))
+    return casos
+
+
+def cargar_historial(db_path: str, limite: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Casos desde filas de historial con exito definido"""
+    from database import DatabaseManager
+
+    casos = []
+    for fila in DatabaseManager(db_path).historial_etiquetado(limite):
+        casos.append({
+            "equipo": fila["equipo_tipo"],
+            "sintoma": fila["sintoma"],
+            "descripcion": "",
+            # Solo una solución que funcionó sirve como referencia
+            "soluciones": [fila["solucion"]] if fila["exito"] and fila["solucion"] else [],
+        })
+    return casos
+
+
+def cargar_replay(transporte: ReplayTransport, limite: Optional[int] = None):
+    """Casos y configuraciones grabadas a partir de un log de llm_transport"""
+    plantillas = {huella_sistema(p.sistema): p for p in PLANTILLAS.values()}
+    casos, vistos, configs = [], set(), []
+    for registro in transporte.grabaciones:
+        # Sin la plantilla actual el prefijo de sistema ya no coincide con lo grabado
+        plantilla = plantillas.get(registro["s"])
+        if plantilla is None:
+            continue
+        config = {"model": registro["m"], **registro["o"]}
+        if config not in configs:
+            configs.append(config)
+        if (registro["s"], registro["p"]) not in vistos:
+            vistos.add((registro["s"], registro["p"]))
+            casos.append({"plantilla": plantilla, "prompt": registro["p"]})
+    return casos[:limite], configs
+
+
+def expandir_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    claves = list(grid)
+    return [dict(zip(claves, valores)) for valores in itertools.product(*grid.values())]
+
+
+def es_valido(texto: str) -> bool:
+    """El texto contiene un JSON con todas las claves del esquema y tipos correctos"""
+    inicio = texto.find('{')
+    fin = texto.rfind('}') + 1
+    if inicio == -1 or fin == 0:
+        return False
+    try:
+        datos = json.loads(texto[inicio:fin])
+    except json.JSONDecodeError:
+        return False
+    return isinstance(datos, dict) and all(
+        isinstance(datos.get(clave), tipo) for clave, tipo in ESQUEMA.items()
+    )
+
+
+def _palabras(texto: str) -> set:
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c if c.isalnum() else " " for c in texto if not unicodedata.combining(c))
+    return {p for p in texto.split() if len(p) > 3}
+
+
+def solapamiento(pasos: List[str], soluciones: List[str]) -> float:
+    """Fracción de palabras de las soluciones conocidas presentes en los pasos generados"""
+    esperadas = _palabras(" ".join(soluciones))
+    if not esperadas:
+        return 0.0
+    return len(esperadas & _palabras(" ".join(str(p) for p in pasos))) / len(esperadas)
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def crear_handler(config: Dict[str, Any], transporte=None) -> HandlerEvaluado:
+    opciones = {k: v for k, v in config.items() if k not in ("model", "temperature", "num_predict")}
+    handler = HandlerEvaluado(model=config.get("model", "phi"), transporte=transporte, **opciones)
+    if "temperature" in config:
+        handler.temperature = config["temperature"]
+    if "num_predict" in config:
+        handler.max_tokens = config["num_predict"]
+    return handler
+
+
+def evaluar_configuracion(config: Dict[str, Any], casos: List[Dict[str, Any]],
+                          handler: Optional[HandlerEvaluado] = None,
+                          transporte=None, db=None) -> Dict[str, Any]:
+    """Reproducir todos los casos con una configuración y resumir métricas"""
+    handler = handler or crear_handler(config, transporte)
+    latencias, tokens, solapes = [], [], []
+    validos = errores = 0
+
+    for caso in casos:
+        if isinstance(handler.transporte, FixtureTransport):
+            handler.transporte.grabacion = caso
+        casos_similares = []
+        if db and "equipo" in caso:
+            casos_similares = db.buscar_fallas_similares(caso["equipo"], caso["sintoma"])
+
+        inicio = time.perf_counter()
+        if "prompt" in caso:
+            # Caso de replay: se reenvía el prompt grabado tal cual
+            diagnostico = handler._ejecutar_plantilla(caso["plantilla"], caso["prompt"])
+        else:
+            diagnostico = handler.diagnosticar_falla(
+                caso["equipo"], caso["sintoma"], caso.get("descripcion", ""), casos_similares
+            )
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+
+        response = handler.ultima_respuesta
+        fallo = response is None or handler.ultimo_error is not None
+        handler.ultima_respuesta = None
+        handler.ultimo_error = None
+
+        if caso.get("soluciones"):
+            pasos = [] if fallo else diagnostico.get("pasos_solucion", [])
+            solapes.append(solapamiento(pasos, caso["soluciones"]))
+        if fallo:
+            # Un fallo rápido no es una respuesta rápida: fuera de latencia y tokens
+            errores += 1
+            continue
+
+        if response.get("total_duration"):
+            duracion_ms = response["total_duration"] / 1e6
+
+        latencias.append(duracion_ms)
+        tokens.append(response.get("eval_count") or 0)
+        validos += es_valido(response.get("response", ""))
+
+    total = len(casos) or 1
+    return {
+        "config": config,
+        "casos": len(casos),
+        "errores": errores,
+        "validez_esquema": round(validos / total, 3),
+        "solapamiento_soluciones": round(sum(solapes) / len(solapes), 3) if solapes else None,
+        "tokens_generados_promedio": round(sum(tokens) / len(tokens), 1) if tokens else 0.0,
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50), 1),
+            "p90": round(percentil(latencias, 90), 1),
+            "p99": round(percentil(latencias, 99), 1),
+        },
+    }
+
+
+def mejor_configuracion(resultados: List[Dict[str, Any]], tolerancia=0.05) -> Optional[Dict[str, Any]]:
+    """La configuración más rápida (p50) que no pierde calidad frente a la mejor"""
+    # Con errores la latencia no es comparable: esas configuraciones no se recomiendan
+    resultados = [r for r in resultados if r["errores"] == 0]
+    if not resultados:
+        return None
+    mejor_validez = max(r["validez_esquema"] for r in resultados)
+    mejor_solape = max(r["solapamiento_soluciones"] or 0 for r in resultados)
+    aceptables = [
+        r for r in resultados
+        if r["validez_esquema"] >= mejor_validez - tolerancia
+        and (r["solapamiento_soluciones"] or 0) >= mejor_solape - tolerancia
+    ]
+    return min(aceptables, key=lambda r: r["latencia_ms"]["p50"])
+
+
+def imprimir_tabla(resultados: List[Dict[str, Any]]):
+    print(f"{'configuración':<60} {'errores':>7} {'válido':>7} {'solape':>7} {'tokens':>7} "
+          f"{'p50 ms':>9} {'p90 ms':>9}")
+    for r in resultados:
+        config = ", ".join(f"{k}={v}" for k, v in r["config"].items())
+        solape = r["solapamiento_soluciones"]
+        print(f"{config:<60} {r['errores']:>7} {r['validez_esquema']:>7.2f} "
+              f"{solape if solape is not None else '-':>7} {r['tokens_generados_promedio']:>7} "
+              f"{r['latencia_ms']['p50']:>9} {r['latencia_ms']['p90']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluar calidad vs latencia del diagnóstico")
+    parser.add_argument("--fixture", help="JSONL con casos etiquetados")
+    parser.add_argument("--db", help="Base SQLite de la que leer el historial etiquetado")
+    parser.add_argument("--limite", type=int, help="Máximo de casos a evaluar")
+    parser.add_argument("--grid", help="JSON con listas de valores por parámetro")
+    parser.add_argument("--simulado", action="store_true",
+                        help="Usar las respuestas grabadas del fixture en lugar de Ollama")
+    parser.add_argument("--replay", help="Log de llm_transport del que reproducir casos y respuestas")
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    grid = None
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grid = json.load(f)
+
+    db = None
+    transporte = None
+    if args.replay:
+        if args.fixture or args.db or args.simulado:
+            parser.error("--replay toma los casos del log: no se combina con --fixture, --db ni --simulado")
+        # Estricto: una configuración distinta de la grabada no debe recibir respuestas ajenas.
+        # Sin latencia simulada: se usa total_duration de la respuesta grabada
+        transporte = ReplayTransport(args.replay, latencia="ninguna", estricto=True)
+        casos, grabadas = cargar_replay(transporte, args.limite)
+        if not casos:
+            parser.error("Ningún registro del log coincide con las plantillas actuales")
+        if grid:
+            # El grid se aplica sobre la primera configuración grabada
+            configs = [{**grabadas[0], **cambios} for cambios in expandir_grid(grid)]
+        else:
+            configs = grabadas
+    else:
+        if args.fixture:
+            casos = cargar_fixture(args.fixture)[:args.limite]
+        elif args.db:
+            from database import DatabaseManager
+            db = DatabaseManager(args.db)
+            casos = cargar_historial(args.db, args.limite)
+        else:
+            parser.error("Indica --fixture, --db o --replay")
+        if args.simulado:
+            transporte = FixtureTransport()
+        configs = expandir_grid(grid or GRID_POR_DEFECTO)
+
+    resultados = [
+        evaluar_configuracion(config, casos, transporte=transporte, db=db)
+        for config in configs
+    ]
+
+    imprimir_tabla(resultados)
+    if args.simulado:
+        # Todas las configuraciones reciben la misma respuesta grabada
+        mejor = None
+        print("\nModo simulado: las filas son idénticas por construcción, no hay recomendación")
+    else:
+        mejor = mejor_configuracion(resultados)
+        if mejor:
+            print(f"\nRecomendada: {mejor['config']}")
+        else:
+            print("\nNinguna configuración terminó sin errores")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"resultados": resultados, "recomendada": mejor}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
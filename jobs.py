@@ -0,0 +1,219 @@
+import sqlite3
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+ESTADOS_FINALES = (COMPLETADO, ERROR)
+
+# Un job que tumba el proceso (p. ej. OOM) no se reintenta indefinidamente
+MAX_INTENTOS = 2
+
+
+class JobStore:
+    """Cola persistente de diagnósticos en SQLite (tabla jobs)"""
+
+    def __init__(self, db_path="data/knowledge_base.db", ttl_segundos=24 * 3600,
+                 max_intentos=MAX_INTENTOS):
+        self.db_path = db_path
+        self.ttl_segundos = ttl_segundos
+        self.max_intentos = max_intentos
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Crear tabla de jobs y reencolar los que quedaron a medias"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            progreso REAL DEFAULT 0,
+            payload TEXT NOT NULL,  -- JSON del reporte
+            resultado TEXT,  -- JSON del diagnóstico
+            error TEXT,
+            intentos INTEGER DEFAULT 0,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+
+        # Jobs interrumpidos varias veces se dan por fallidos; el resto vuelve a la cola
+        cursor.execute(
+            """UPDATE jobs SET status = ?, error = ?, finished_at = ?
+               WHERE status = ? AND intentos >= ?""",
+            (ERROR, "interrumpido repetidamente", time.time(), EN_PROCESO, self.max_intentos)
+        )
+        cursor.execute(
+            "UPDATE jobs SET status = ?, progreso = 0, started_at = NULL WHERE status = ?",
+            (PENDIENTE, EN_PROCESO)
+        )
+
+        conn.commit()
+        conn.close()
+
+    def crear(self, payload: Dict[str, Any]) -> str:
+        """Encolar un reporte y devolver el id del job"""
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, PENDIENTE, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+        conn.commit()
+        conn.close()
+        return job_id
+
+    def tomar_siguiente(self) -> Optional[Dict[str, Any]]:
+        """Reclamar el job pendiente más antiguo (atómico entre workers)"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (PENDIENTE,)
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+
+            conn.execute(
+                """UPDATE jobs SET status = ?, progreso = 0.1, started_at = ?,
+                   intentos = intentos + 1 WHERE id = ?""",
+                (EN_PROCESO, time.time(), row['id'])
+            )
+            conn.commit()
+            job = dict(row)
+            job['payload'] = json.loads(job['payload'])
+            return job
+        finally:
+            conn.close()
+
+    def completar(self, job_id: str, resultado: Dict[str, Any]):
+        conn = self._connect()
+        conn.execute(
+            """UPDATE jobs SET status = ?, progreso = 1, resultado = ?, finished_at = ?
+               WHERE id = ?""",
+            (COMPLETADO, json.dumps(resultado, ensure_ascii=False), time.time(), job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def fallar(self, job_id: str, error: str):
+        conn = self._connect()
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (ERROR, error, time.time(), job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def obtener(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado público del job, o None si no existe o expiró"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row['id'],
+            "status": row['status'],
+            "progreso": row['progreso'],
+            "resultado": json.loads(row['resultado']) if row['resultado'] else None,
+            "error": row['error'],
+            "created_at": row['created_at'],
+            "started_at": row['started_at'],
+            "finished_at": row['finished_at'],
+        }
+        if row['started_at']:
+            job["espera_segundos"] = round(row['started_at'] - row['created_at'], 3)
+        if row['finished_at'] and row['started_at']:
+            job["duracion_segundos"] = round(row['finished_at'] - row['started_at'], 3)
+        return job
+
+    def purgar_expirados(self) -> int:
+        """Borrar jobs terminados cuyo TTL ya venció"""
+        limite = time.time() - self.ttl_segundos
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (*ESTADOS_FINALES, limite)
+        )
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    def contar_por_estado(self) -> Dict[str, int]:
+        conn = self._connect()
+        rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        conn.close()
+        return {row[0]: row[1] for row in rows}
+
+
+class JobWorker:
+    """Hilos que consumen la cola de jobs y ejecutan el diagnóstico"""
+
+    def __init__(self, store: JobStore, procesar: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 num_workers=1, intervalo=0.5):
+        self.store = store
+        self.procesar = procesar
+        self.num_workers = num_workers  # 1 por defecto: el LLM ya satura la RAM
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._nuevo_job = threading.Event()
+        self._hilos = []
+
+    def iniciar(self):
+        for i in range(self.num_workers):
+            hilo = threading.Thread(target=self._bucle, name=f"job-worker-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self):
+        self._detener.set()
+        self._nuevo_job.set()
+        for hilo in self._hilos:
+            hilo.join(timeout=5)
+
+    def notificar(self):
+        """Despertar a los workers tras encolar un job"""
+        self._nuevo_job.set()
+
+    def _bucle(self):
+        ultima_purga = 0.0
+        while not self._detener.is_set():
+            if time.time() - ultima_purga > 300:
+                self.store.purgar_expirados()
+                ultima_purga = time.time()
+
+            job = self.store.tomar_siguiente()
+            if job is None:
+                self._nuevo_job.wait(self.intervalo)
+                self._nuevo_job.clear()
+                continue
+
+            try:
+                resultado = self.procesar(job['payload'])
+                self.store.completar(job['id'], resultado)
+            except Exception as e:
+                print(f"Error en job {job['id']}: {traceback.format_exc()}")
+                self.store.fallar(job['id'], str(e))
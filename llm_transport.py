@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Campos de la respuesta de Ollama que se conservan al grabar
+CAMPOS_RESPUESTA = (
+    "response", "done", "total_duration", "load_duration",
+    "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+)
+
+
+def clave_peticion(model: str, system: str, prompt: str, options: Optional[Dict[str, Any]]) -> str:
+    """Huella estable de una petición (keep_alive no afecta a la respuesta)"""
+    datos = json.dumps([model, system or "", prompt, options or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(datos.encode("utf-8")).hexdigest()
+
+
+def huella_sistema(system: Optional[str]) -> str:
+    """Huella corta del prefijo de sistema guardada en cada registro"""
+    return hashlib.sha1((system or "").encode("utf-8")).hexdigest()[:12]
+
+
+class OllamaTransport:
+    """Transporte real: llama a ollama.generate"""
+
+    def __init__(self):
+        # Import diferido: el modo replay no necesita el cliente instalado
+        import ollama
+        self._generate = ollama.generate
+
+    def generar(self, **kwargs) -> Dict[str, Any]:
+        return self._generate(**kwargs)
+
+    def cerrar(self):
+        pass
+
+
+class GrabadorTransport:
+    """Envuelve otro transporte y guarda petición/respuesta/tiempos en JSONL compacto"""
+
+    def __init__(self, interno, ruta="data/llm_log.jsonl"):
+        self.interno = interno
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        # JSONL plano con flush por línea: una caída de la API no corrompe lo ya grabado
+        self._archivo = open(ruta, "a", encoding="utf-8")
+
+    def generar(self, **kwargs) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        response = self.interno.generar(**kwargs)
+        t_ms = (time.perf_counter() - inicio) * 1000
+
+        registro = {
+            "k": clave_peticion(kwargs.get("model"), kwargs.get("system"),
+                                kwargs.get("prompt"), kwargs.get("options")),
+            "m": kwargs.get("model"),
+            # El prefijo de sistema es casi siempre el mismo: basta su huella
+            "s": huella_sistema(kwargs.get("system")),
+            "p": kwargs.get("prompt"),
+            "o": kwargs.get("options") or {},
+            "r": {campo: response[campo] for campo in CAMPOS_RESPUESTA if campo in response},
+            "t_ms": round(t_ms, 1),
+        }
+        linea = json.dumps(registro, ensure_ascii=False, separators=(",", ":"))
+
+        with self._lock:
+            self._archivo.write(linea + "\n")
+            self._archivo.flush()
+        return response
+
+    def cerrar(self):
+        with self._lock:
+            self._archivo.close()
+        self.interno.cerrar()
+
+
+class ReplayTransport:
+    """Sirve respuestas grabadas sin inferencia, con latencia nula, grabada o escalada"""
+
+    def __init__(self, ruta="data/llm_log.jsonl", latencia="ninguna", escala=1.0, estricto=False):
+        if latencia not in ("ninguna", "grabada"):
+            raise ValueError(f"Modo de latencia no soportado: {latencia}")
+        self.latencia = latencia
+        self.escala = escala
+        self.estricto = estricto  # Si es False, una petición no grabada recibe la siguiente grabación
+        self.registros: Dict[str, List[Dict[str, Any]]] = {}
+        self.grabaciones: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._cargar(ruta)
+        self._ciclo = itertools.cycle(self.grabaciones)
+        self._indices: Dict[str, int] = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _cargar(self, ruta: str):
+        # Se aceptan logs comprimidos a posteriori con gzip
+        abrir = gzip.open if ruta.endswith(".gz") else open
+        with abrir(ruta, "rt", encoding="utf-8") as f:
+            try:
+                for linea in f:
+                    try:
+                        registro = json.loads(linea)
+                    except json.JSONDecodeError:
+                        # Última línea a medias tras una caída: se descarta
+                        continue
+                    self.registros.setdefault(registro["k"], []).append(registro)
+                    self.grabaciones.append(registro)
+            except EOFError:
+                # gzip truncado: se conservan los registros leídos hasta ahí
+                pass
+        if not self.grabaciones:
+            raise ValueError(f"No hay respuestas grabadas en {ruta}")
+
+    def _siguiente(self, clave: str) -> Dict[str, Any]:
+        with self._lock:
+            grabados = self.registros.get(clave)
+            if grabados:
+                self.aciertos += 1
+                # Rotar entre respuestas distintas a la misma petición
+                i = self._indices.get(clave, 0)
+                self._indices[clave] = i + 1
+                return grabados[i % len(grabados)]
+
+            self.fallos += 1
+            if self.estricto:
+                raise KeyError(f"Petición no grabada: {clave}")
+            return next(self._ciclo)
+
+    def generar(self, **kwargs) -> Dict[str, Any]:
+        registro = self._siguiente(clave_peticion(
+            kwargs.get("model"), kwargs.get("system"), kwargs.get("prompt"), kwargs.get("options")
+        ))
+        if self.latencia == "grabada":
+            time.sleep(registro["t_ms"] * self.escala / 1000)
+        return dict(registro["r"])
+
+    def cerrar(self):
+        pass
+
+
+def crear_transporte(modo: str = "ollama", ruta="data/llm_log.jsonl",
+                     latencia="ninguna", escala=1.0):
+    """Transporte según modo: ollama, grabar o replay"""
+    if modo == "ollama":
+        return OllamaTransport()
+    if modo == "grabar":
+        return GrabadorTransport(OllamaTransport(), ruta)
+    if modo == "replay":
+        return ReplayTransport(ruta, latencia=latencia, escala=escala)
+    raise ValueError(f"Transporte LLM desconocido: {modo}")
@@ -1,50 +1,65 @@
-import ollama
 import json
 import time
 from typing import Dict, Any, List
 
+from llm_transport import OllamaTransport
+from prompt_templates import (
+    PLANTILLAS, EstadisticasPlantilla, PlantillaPrompt, obtener_plantilla
+)
+
 class OllamaHandlerOptimized:
-    def __init__(self, model="phi"):
+    def __init__(self, model="phi", keep_alive="30m", transporte=None, **opciones):
         self.model = model
+        # Backend del LLM: real, grabador o replay (ver llm_transport)
+        self.transporte = transporte or OllamaTransport()
         self.max_tokens = 512  # Reducido para ahorrar RAM
         self.temperature = 0.3  # Más determinista
+        self.keep_alive = keep_alive  # Mantener modelo (y KV del prefijo) cargado
+        # Opciones de muestreo; se pueden sobrescribir (top_k, num_ctx, ...)
+        self.opciones = {
+            'top_k': 20,
+            'top_p': 0.8,
+            'repeat_penalty': 1.1,
+            'num_thread': 2,  # Usar solo 2 threads
+            **opciones
+        }
+        self.metricas: Dict[str, EstadisticasPlantilla] = {
+            p.clave: EstadisticasPlantilla() for p in PLANTILLAS.values()
+        }
+
+    def _registrar_metricas(self, plantilla: PlantillaPrompt, response: Dict[str, Any]):
+        self.metricas.setdefault(plantilla.clave, EstadisticasPlantilla()).registrar(response)
+
+    def metricas_prompts(self) -> Dict[str, Dict[str, Any]]:
+        """Tokens evaluados y tiempo de prefill acumulados por plantilla"""
+        return {clave: est.resumen() for clave, est in list(self.metricas.items())}
         
     def generar_diagnostico(self, contexto: str) -> Dict[str, Any]:
         """Generar diagnóstico optimizado para baja RAM"""
-        
-        prompt = f"""Eres un técnico especialista en mantenimiento de equipos.
-        
-Contexto:
-{contexto}
+        plantilla = obtener_plantilla("diagnostico")
+        return self._ejecutar_plantilla(plantilla, plantilla.render(contexto=contexto))
 
-Responde ÚNICAMENTE en formato JSON con esta estructura exacta:
-{{
-    "diagnostico": "diagnóstico principal",
-    "causas_posibles": ["causa1", "causa2", "causa3"],
-    "pasos_solucion": ["paso1", "paso2", "paso3"],
-    "herramientas_necesarias": ["herramienta1", "herramienta2"],
-    "tiempo_estimado_minutos": 30,
-    "nivel_dificultad": "Bajo/Medio/Alto",
-    "precauciones": ["precaucion1", "precaucion2"]
-}}
+    def _generar(self, **kwargs) -> Dict[str, Any]:
+        """Llamada al modelo; punto único para sustituir el backend"""
+        return self.transporte.generar(**kwargs)
 
-Mantén las respuestas concisas y prácticas.
-"""
+    def _ejecutar_plantilla(self, plantilla: PlantillaPrompt, prompt: str) -> Dict[str, Any]:
+        """Enviar prompt variable con el prefijo de sistema estático de la plantilla"""
         
         try:
             # Configuración optimizada para baja RAM
-            response = ollama.generate(
+            response = self._generar(
                 model=self.model,
+                system=plantilla.sistema,
                 prompt=prompt,
+                keep_alive=self.keep_alive,
                 options={
                     'num_predict': self.max_tokens,
                     'temperature': self.temperature,
-                    'top_k': 20,
-                    'top_p': 0.8,
-                    'repeat_penalty': 1.1,
-                    'num_thread': 2  # Usar solo 2 threads
+                    **self.opciones
                 }
             )
+            self._registrar_metricas(plantilla, response)
             
             # Parsear respuesta JSON
             respuesta_texto = response['response']
@@ -96,14 +111,12 @@ Mantén las respuestas concisas y prácticas.
             for caso in casos_similares[:3]:  # Limitar a 3 casos
                 contexto_casos += f"- {caso['sintoma']}: {caso['soluciones'][0] if caso['soluciones'] else 'Sin solución registrada'}\n"
         
-        contexto = f"""
-INFORMACIÓN DE LA FALLA:
-- Equipo: {equipo}
-- Síntoma principal: {sintoma}
-- Descripción detallada: {descripcion}
-{contexto_casos}
-
-Proporciona un diagnóstico técnico práctico.
-"""
+        plantilla = obtener_plantilla("falla")
+        prompt = plantilla.render(
+            equipo=equipo,
+            sintoma=sintoma,
+            descripcion=descripcion,
+            casos=contexto_casos
+        )
         
-        return self.generar_diagnostico(contexto)
\ No newline at end of file
+        return self._ejecutar_plantilla(plantilla, prompt)
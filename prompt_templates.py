@@ -0,0 +1,97 @@
+import threading
+from string import Template
+from typing import Dict, Any
+
+# Versión del conjunto de plantillas: solo etiqueta las métricas (nombre@version);
+# la caché KV de Ollama depende únicamente del texto de `sistema`
+PROMPT_VERSION = "2"
+
+
+class PlantillaPrompt:
+    """Plantilla compilada: prefijo de sistema estático + cuerpo variable"""
+
+    def __init__(self, nombre: str, version: str, sistema: str, cuerpo: str):
+        self.nombre = nombre
+        self.version = version
+        # El sistema se envía tal cual en cada llamada; al ser idéntico,
+        # Ollama reutiliza el KV del prefijo mientras el modelo siga cargado
+        self.sistema = sistema.strip()
+        self._cuerpo = Template(cuerpo)
+
+    @property
+    def clave(self) -> str:
+        return f"{self.nombre}@{self.version}"
+
+    def render(self, **valores) -> str:
+        """Construir solo la parte variable del prompt"""
+        return self._cuerpo.substitute(**valores)
+
+
+class EstadisticasPlantilla:
+    """Acumulado de tokens y tiempo de prefill por plantilla"""
+
+    def __init__(self):
+        # Los workers de jobs registran en paralelo
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.prompt_eval_tokens = 0
+        self.prefill_ms = 0.0
+        self.eval_tokens = 0
+
+    def registrar(self, response: Dict[str, Any]):
+        with self._lock:
+            self.llamadas += 1
+            self.prompt_eval_tokens += response.get('prompt_eval_count') or 0
+            self.prefill_ms += (response.get('prompt_eval_duration') or 0) / 1e6
+            self.eval_tokens += response.get('eval_count') or 0
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._lock:
+            llamadas = self.llamadas or 1
+            return {
+                "llamadas": self.llamadas,
+                "prompt_eval_tokens": self.prompt_eval_tokens,
+                "prompt_eval_tokens_promedio": round(self.prompt_eval_tokens / llamadas, 1),
+                "prefill_ms_total": round(self.prefill_ms, 2),
+                "prefill_ms_promedio": round(self.prefill_ms / llamadas, 2),
+                "eval_tokens": self.eval_tokens,
+            }
+
+
+SISTEMA_DIAGNOSTICO = """Eres un técnico especialista en mantenimiento de equipos.
+
+Responde ÚNICAMENTE en formato JSON con esta estructura exacta:
+{
+    "diagnostico": "diagnóstico principal",
+    "causas_posibles": ["causa1", "causa2", "causa3"],
+    "pasos_solucion": ["paso1", "paso2", "paso3"],
+    "herramientas_necesarias": ["herramienta1", "herramienta2"],
+    "tiempo_estimado_minutos": 30,
+    "nivel_dificultad": "Bajo/Medio/Alto",
+    "precauciones": ["precaucion1", "precaucion2"]
+}
+
+Mantén las respuestas concisas y prácticas.
+"""
+
+# Plantillas compiladas una sola vez al importar el módulo
+PLANTILLAS = {
+    "diagnostico": PlantillaPrompt(
+        "diagnostico", PROMPT_VERSION, SISTEMA_DIAGNOSTICO,
+        "Contexto:\n$contexto\n"
+    ),
+    "falla": PlantillaPrompt(
+        "falla", PROMPT_VERSION, SISTEMA_DIAGNOSTICO,
+        """INFORMACIÓN DE LA FALLA:
+- Equipo: $equipo
+- Síntoma principal: $sintoma
+- Descripción detallada: $descripcion
+$casos
+Proporciona un diagnóstico técnico práctico.
+"""
+    ),
+}
+
+
+def obtener_plantilla(nombre: str) -> PlantillaPrompt:
+    return PLANTILLAS[nombre]
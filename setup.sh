@@ -22,7 +22,7 @@ echo "📥 Instalando dependencias..."
 pip install --upgrade pip
 pip install fastapi==0.104.1 uvicorn[standard]==0.24.0 pydantic==2.5.0
 pip install sqlalchemy==2.0.23 aiofiles==23.2.0
-pip install ollama==0.1.2 streamlit==1.28.0 requests==2.31.0
+pip install ollama==0.1.6 streamlit==1.28.0 requests==2.31.0
 
 # Descargar modelo ligero
 echo "🤖 Descargando modelo Phi (ligero)..."
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import json
+import time
 from datetime import datetime
 
 # Configurar página
@@ -125,15 +126,40 @@ with tab1:
                 # Enviar a API (sin el campo urgencia que no está en el modelo)
                 api_data = {k: v for k, v in data.items() if k != 'urgencia'}
                 
-                response = requests.post(
-                    f"{api_url}/diagnosticar",
-                    json=api_data,
-                    timeout=30
-                )
+                # Reutilizar el job si ya se envió este mismo reporte (evita reenviar tras un timeout)
+                if st.session_state.get('job_data') != data:
+                    response = requests.post(
+                        f"{api_url}/diagnosticar",
+                        json=api_data,
+                        timeout=10
+                    )
+                    response.raise_for_status()
+                    st.session_state.job_id = response.json()["job_id"]
+                    st.session_state.job_data = data
                 
-                if response.status_code == 200:
-                    resultado = response.json()
-                    diagnostico = resultado.get("data", {})
+                # Esperar resultado con long-polling, con un límite total
+                limite = time.monotonic() + 300
+                job = {"status": "pendiente"}
+                while job.get("status") not in ("completado", "error"):
+                    if time.monotonic() >= limite:
+                        # El job sigue en cola: se conserva para reutilizarlo al reintentar
+                        raise requests.exceptions.Timeout()
+                    response = requests.get(
+                        f"{api_url}/jobs/{st.session_state.job_id}",
+                        params={"esperar": 25},
+                        timeout=30
+                    )
+                    if response.status_code != 200:
+                        break
+                    job = response.json()
+                
+                # Un job fallido o expirado no se reutiliza en el siguiente envío
+                if response.status_code != 200 or job.get("status") == "error":
+                    st.session_state.pop('job_data', None)
+                    st.session_state.pop('job_id', None)
+                
+                if response.status_code == 200 and job.get("status") == "completado":
+                    diagnostico = job.get("resultado") or {}
                     st.session_state.diagnostico_data = diagnostico
                     
                     st.success("✅ Diagnóstico completado")
@@ -184,6 +210,8 @@ with tab1:
                             for herramienta in herramientas:
                                 st.write(f"🔨 {herramienta}")
                     
+                elif response.status_code == 200:
+                    st.error(f"Error en el diagnóstico: {job.get('error')}")
                 else:
                     st.error(f"Error en el diagnóstico: {response.text}")
                     
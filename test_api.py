@@ -17,10 +17,22 @@ def test_diagnostico():
             timeout=10
         )
         
-        if response.status_code == 200:
-            resultado = response.json()
-            print("✅ API funciona correctamente")
-            print(f"Diagnóstico: {resultado['data']['diagnostico'][:100]}...")
+        if response.status_code == 202:
+            job_id = response.json()['job_id']
+            print(f"⏳ Job encolado: {job_id}")
+            
+            resultado = requests.get(
+                f"http://localhost:8000/jobs/{job_id}",
+                params={"esperar": 60},
+                timeout=65
+            ).json()
+            if resultado['status'] == 'completado':
+                print("✅ API funciona correctamente")
+                print(f"Diagnóstico: {resultado['resultado']['diagnostico'][:100]}...")
+            else:
+                print(f"❌ Job no completado: {resultado['status']}")
+                if resultado['error']:
+                    print(resultado['error'])
         else:
             print(f"❌ Error en API: {response.status_code}")
             print(response.text)